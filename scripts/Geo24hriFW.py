@@ -10,15 +10,21 @@ GitHub 高性能数据采集系统 (Single File Modularized Edition)
 """
 
 import asyncio
+import calendar
+import heapq
 import json
 import logging
 import os
+import random
+import re
 import signal
+import sqlite3
 import sys
 import time
-from dataclasses import asdict, dataclass
+from collections import deque
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional, Any
+from typing import Dict, List, Optional, Tuple, Any
 
 # ==============================================================================
 # 0. 全局初始化与依赖检查
@@ -32,11 +38,21 @@ logger = logging.getLogger("GH-Collector")
 try:
     import aiohttp
     import aiosqlite
-    from tqdm.asyncio import tqdm
 except ImportError:
-    print("错误: 缺少必要依赖。请执行: pip install aiohttp aiosqlite tqdm")
+    print("错误: 缺少必要依赖。请执行: pip install aiohttp aiosqlite")
     sys.exit(1)
 
+# 可选加速：安装 orjson 时使用 C 实现的 JSON 编解码，否则回退标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps_bytes = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj).encode()
+
 # ==============================================================================
 # 模块 1: [Config] 配置层
 # 功能: 集中管理所有硬编码参数、SQL模板和环境变量
@@ -56,19 +72,26 @@ class AppConfig:
     CONCURRENT_REPOS = 5    # 并发采集仓库数 (Semaphore)
     PAGE_SIZE = 100         # 单次请求获取的 Commit 数
     MAX_RETRIES = 5         # API 请求重试次数
-    WRITE_BATCH_SIZE = 50   # 数据库批量写入阈值
+    WRITE_BATCH_SIZE = 500  # 数据库批量写入阈值
+    TX_COMMIT_ROWS = 5000   # 事务累计写入行数达到该值即提交
+    TX_COMMIT_SECONDS = 2.0 # 事务最长持续时间 (秒)，超时即提交
+    QUEUE_MAX_ROWS = 100000 # 队列中允许积压的最大行数 (背压阈值)
+    CONSUMER_COUNT = 2      # 并行消费者数量 (写库由连接锁串行化)
+    CHECKPOINT_MAX_DRIFT = 86400  # 断点窗口终点与本次窗口终点允许的最大偏差 (秒)，超出则丢弃断点重新采集
+    INSERT_CHUNK_ROWS = 500 # 单条多行 INSERT 的最大行数 (实际取值受 SQLite 参数上限约束，见 AsyncDatabase.connect)
     
     # 网络超时 (总计60秒, 连接10秒)
     TIMEOUT = aiohttp.ClientTimeout(total=60, connect=10)
 
     # GraphQL 查询模板 (优化载荷，仅查询必要字段)
+    # owner/name 在单个仓库的翻页过程中不变，按仓库特化一次后内联进查询，仅 since/until/cursor 作为变量
     GRAPHQL_TEMPLATE = """
-    query($owner: String!, $name: String!, $since: GitTimestamp!, $until: GitTimestamp!, $cursor: String) {
-      repository(owner: $owner, name: $name) {
+    query($since: GitTimestamp!, $until: GitTimestamp!, $cursor: String) {
+      repository(owner: %(owner)s, name: %(name)s) {
         defaultBranchRef {
           target {
             ... on Commit {
-              history(since: $since, until: $until, first: %d, after: $cursor) {
+              history(since: $since, until: $until, first: %(page_size)d, after: $cursor) {
                 pageInfo { hasNextPage endCursor }
                 edges {
                   node {
@@ -76,8 +99,6 @@ class AppConfig:
                     messageHeadline
                     committedDate
                     author {
-                      name
-                      email
                       user { login }
                     }
                   }
@@ -88,18 +109,35 @@ class AppConfig:
         }
       }
     }
-    """ % PAGE_SIZE
+    """
+    # 加载时压缩空白：缩进对 GraphQL 无意义，去除后每个请求体少发数百字节
+    GRAPHQL_TEMPLATE = re.sub(r"\s+", " ", GRAPHQL_TEMPLATE).strip()
 
 # ==============================================================================
 # 模块 2: [Models] 数据模型层
 # 功能: 定义核心数据结构，解耦业务逻辑与数据存储格式
 # ==============================================================================
 
-@dataclass(frozen=True)
+def parse_github_ts(s: str) -> int:
+    """
+    将 GitHub 的 ISO-8601 UTC 时间 (YYYY-MM-DDTHH:MM:SSZ) 转为 Unix 时间戳
+    固定格式直接按位切片取整，省去 datetime 对象构造与时区换算；非标准格式回退 fromisoformat
+    """
+    if len(s) == 20 and s[19] == "Z":
+        return calendar.timegm((
+            int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19]), 0, 0, 0
+        ))
+    return int(datetime.fromisoformat(s.replace("Z", "+00:00")).timestamp())
+
+# 数据库行格式: (sha, repo, author_login, ts_unix, message)
+# 采集热路径直接构造该元组入队，不再经过 CommitRecord 中转
+
+@dataclass(frozen=True, slots=True)
 class CommitRecord:
     """
     Commit 业务实体
-    使用 frozen=True 确保数据不可变，线程安全
+    使用 frozen=True 确保数据不可变，线程安全；slots=True 省去每个实例的 __dict__
+    注意: 仅供外部调用方使用，采集流水线内部直接传递行元组
     """
     repo_name: str
     commit_sha: str
@@ -110,15 +148,13 @@ class CommitRecord:
     message: str
 
     def to_db_row(self) -> tuple:
-        """转换逻辑：将对象序列化为数据库行格式"""
+        """转换逻辑：将对象转换为数据库行格式"""
         return (
             self.commit_sha,
             self.repo_name,
             self.author_login,
             self.timestamp_unix,
             self.message,
-            # 保留原始数据的 JSON 备份，便于后续扩展字段
-            json.dumps(asdict(self))
         )
 
 # ==============================================================================
@@ -131,40 +167,67 @@ class TokenPool:
     Token 资源管理器
     职责：负载均衡 (Round-Robin) 与 速率限制 (Rate Limiting)
     """
+    # 匿名访问时使用的请求头 (请求体为预序列化的 JSON 字节)
+    _ANON_HEADERS: Dict[str, str] = {"Content-Type": "application/json"}
+
     def __init__(self, tokens: List[str]):
         # 记录 Token 的冷却结束时间戳 (0.0 表示可用)
         self._tokens = {t: 0.0 for t in tokens}
-        self._lock = asyncio.Lock() # 保证并发安全
+        # 可用队列：asyncio 单线程下 deque 操作在两次 await 之间是原子的，无需加锁
+        # 由去重后的 _tokens 构建，避免重复配置的 Token 在惩罚后仍有副本留在队列中
+        self._ready = deque(self._tokens)
+        # 冷却堆：(解除冷却时间, token)，堆顶即最早可用的 Token
+        self._cooling_heap: List[Tuple[float, str]] = []
+        # 预构建每个 Token 的请求头，避免每次请求重复格式化
+        self._headers = {
+            t: {"User-Agent": "GH-Col-v4", "Authorization": f"Bearer {t}", "Content-Type": "application/json"}
+            for t in tokens
+        }
+        # 最近一次告警的解冻时刻：多个等待者同时休眠时只打印一次日志
+        self._announced_ready_at = 0.0
         
         if not self._tokens:
             logger.warning("未检测到 Token，将尝试匿名访问 (极易受限)")
 
-    async def get_token(self) -> Optional[str]:
-        """获取可用 Token，若全部冷却则阻塞等待"""
-        if not self._tokens: return None
+    def _release_cooled(self, now: float):
+        """将已解除冷却的 Token 从堆中移回可用队列 (跳过被重复惩罚后的过期条目)"""
+        heap = self._cooling_heap
+        while heap and heap[0][0] <= now:
+            ready_at, token = heapq.heappop(heap)
+            if self._tokens[token] == ready_at:
+                self._tokens[token] = 0.0
+                self._ready.append(token)
+
+    async def get_token(self) -> Tuple[Optional[str], Dict[str, str]]:
+        """获取可用 Token 及其预构建的请求头，若全部冷却则阻塞等待"""
+        if not self._tokens: return None, self._ANON_HEADERS
         
-        async with self._lock:
-            while True:
-                now = time.time()
-                # 筛选当前可用的 Token
-                available = [t for t, cd in self._tokens.items() if now >= cd]
-                
-                if available:
-                    token = available[0]
-                    # 轮询策略：取出并放回队尾
-                    del self._tokens[token]
-                    self._tokens[token] = 0.0
-                    return token
-                
-                # 若无可用，计算最小等待时间
-                wait_time = min(self._tokens.values()) - now + 0.5
+        while True:
+            # 快速路径：无锁轮询，取队首并放回队尾
+            if self._cooling_heap:
+                self._release_cooled(time.time())
+            if self._ready:
+                token = self._ready[0]
+                self._ready.rotate(-1)
+                return token, self._headers[token]
+            
+            # 慢速路径：所有 Token 冷却中，休眠至堆顶解冻时刻后重试；
+            # 不持锁休眠，各等待者并行计时、同时醒来，而不是在锁上逐个排队
+            ready_at = self._cooling_heap[0][0]
+            wait_time = ready_at - time.time()
+            if ready_at != self._announced_ready_at:
+                self._announced_ready_at = ready_at
                 logger.warning(f"所有 Token 冷却中，等待 {wait_time:.1f}s")
-                await asyncio.sleep(max(wait_time, 1))
+            await asyncio.sleep(max(wait_time, 0) + 0.5)
 
     def penalize(self, token: str, duration: int = 600):
         """惩罚机制：将触发限流的 Token 暂时移出可用池"""
         if token in self._tokens:
-            self._tokens[token] = time.time() + duration
+            if self._tokens[token] == 0.0:
+                self._ready.remove(token)
+            ready_at = time.time() + duration
+            self._tokens[token] = ready_at
+            heapq.heappush(self._cooling_heap, (ready_at, token))
             logger.warning(f"Token [...{token[-4:]}] 冷却 {duration}s")
 
 class AsyncDatabase:
@@ -174,44 +237,193 @@ class AsyncDatabase:
     """
     def __init__(self, db_path: str):
         self.db_path = db_path
-        self._conn: Optional[aiosqlite.Connection] = None
+        # 读写分离：写连接由消费者独占 (写锁串行化)，读连接只读，互不排队
+        self._writer_conn: Optional[aiosqlite.Connection] = None
+        self._reader_conn: Optional[aiosqlite.Connection] = None
+        # SQLite 单写者模型：多个消费者共享连接时串行化写入 + commit
+        self._write_lock = asyncio.Lock()
+        # 仅使用两条固定 SQL (整块多行 INSERT + 单行 INSERT)，确保命中 sqlite3 的预编译语句缓存；
+        # 若按尾块行数生成不同 SQL，最多会产生 INSERT_CHUNK_ROWS 种语句，冲掉缓存并反复解析
+        # 整块行数取决于运行时 SQLite 的参数上限，在 connect() 中确定
+        self._insert_one_sql = self._build_insert_sql(1)
+        self._chunk_rows = 1
+        self._insert_chunk_sql = self._insert_one_sql
+        # 分组提交状态：多个批次合并进同一事务，按行数或时长提交
+        self._pending = 0
+        self._tx_start: Optional[float] = None
 
     async def connect(self):
         """建立连接并开启 WAL 模式优化性能"""
-        self._conn = await aiosqlite.connect(self.db_path)
+        self._writer_conn = await aiosqlite.connect(self.db_path)
         # WAL 模式允许读写并发，极大提升吞吐量
-        await self._conn.execute("PRAGMA journal_mode=WAL")
-        await self._conn.execute("PRAGMA synchronous=NORMAL")
+        await self._writer_conn.execute("PRAGMA journal_mode=WAL")
+        await self._writer_conn.execute("PRAGMA synchronous=NORMAL")
+        # 写入密集场景的补充调优：临时表放内存、256MB mmap、128MB 页缓存、锁等待 5s；
+        # 自动检查点放宽到 20000 页，使检查点不打断热写入路径 (关闭时再统一截断 WAL)
+        await self._writer_conn.execute("PRAGMA temp_store=MEMORY")
+        await self._writer_conn.execute("PRAGMA mmap_size=268435456")
+        await self._writer_conn.execute("PRAGMA cache_size=-131072")
+        await self._writer_conn.execute("PRAGMA wal_autocheckpoint=20000")
+        await self._writer_conn.execute("PRAGMA busy_timeout=5000")
+
+        # 多行 INSERT 的整块大小：每行 5 个参数，不得超过绑定参数上限
+        # (SQLite < 3.32 默认仅 999，Ubuntu 20.04 / RHEL 8 等系统库仍是此版本)
+        self._chunk_rows = max(1, min(AppConfig.INSERT_CHUNK_ROWS, self._max_variable_number() // 5))
+        self._insert_chunk_sql = self._build_insert_sql(self._chunk_rows)
         
         # 初始化表结构
-        await self._conn.execute("""
+        await self._writer_conn.execute("""
             CREATE TABLE IF NOT EXISTS commits (
                 sha TEXT PRIMARY KEY,
                 repo TEXT,
                 author_login TEXT,
                 ts_unix INTEGER,
-                message TEXT,
-                raw_json TEXT
+                message TEXT
             )
         """)
         # 索引优化
-        await self._conn.execute("CREATE INDEX IF NOT EXISTS idx_repo_ts ON commits(repo, ts_unix)")
-        await self._conn.commit()
-
-    async def save_batch(self, records: List[CommitRecord]):
-        """批量写入，使用 INSERT OR IGNORE 自动去重"""
-        if not records: return
-        try:
-            await self._conn.executemany(
-                "INSERT OR IGNORE INTO commits VALUES (?,?,?,?,?,?)", 
-                [r.to_db_row() for r in records]
+        await self._writer_conn.execute("CREATE INDEX IF NOT EXISTS idx_repo_ts ON commits(repo, ts_unix)")
+        # 断点续传：记录每个仓库已落库的翻页游标及其所属时间窗口 (cursor 为 NULL 表示已采集完毕)
+        await self._writer_conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                repo TEXT PRIMARY KEY,
+                cursor TEXT,
+                max_ts INTEGER,
+                since TEXT,
+                until TEXT
             )
-            await self._conn.commit()
+        """)
+        await self._writer_conn.commit()
+
+        # 只读连接：WAL 下读取已提交快照，不会与写事务互相阻塞
+        self._reader_conn = await aiosqlite.connect(self.db_path)
+        await self._reader_conn.execute("PRAGMA query_only=1")
+        await self._reader_conn.execute("PRAGMA busy_timeout=5000")
+
+    @staticmethod
+    def _max_variable_number() -> int:
+        """返回当前链接的 SQLite 库单条语句可绑定的最大参数个数"""
+        limit = getattr(sqlite3, "SQLITE_LIMIT_VARIABLE_NUMBER", None)
+        if limit is not None:
+            # Python 3.11+：直接读取同一 SQLite 库的运行时上限
+            probe = sqlite3.connect(":memory:")
+            try:
+                return probe.getlimit(limit)
+            finally:
+                probe.close()
+        return 999 if sqlite3.sqlite_version_info < (3, 32, 0) else 32766
+
+    @staticmethod
+    def _build_insert_sql(n_rows: int) -> str:
+        """生成一次插入 n_rows 行的 INSERT OR IGNORE 语句"""
+        # 显式列名：兼容旧版带 raw_json 列的数据库文件
+        return ("INSERT OR IGNORE INTO commits (sha, repo, author_login, ts_unix, message) VALUES "
+                + ",".join(["(?,?,?,?,?)"] * n_rows))
+
+    async def _begin(self):
+        """若当前无活动事务则开启 (调用方需持有写锁)"""
+        if self._tx_start is None:
+            await self._writer_conn.execute("BEGIN IMMEDIATE")
+            self._tx_start = time.monotonic()
+
+    async def _commit(self):
+        """提交活动事务 (调用方需持有写锁)"""
+        if self._tx_start is not None:
+            await self._writer_conn.commit()
+            self._tx_start = None
+            self._pending = 0
+
+    async def _maybe_commit(self):
+        """达到行数或时长阈值时提交 (调用方需持有写锁)"""
+        if self._tx_start is None: return
+        if (self._pending >= AppConfig.TX_COMMIT_ROWS
+                or time.monotonic() - self._tx_start >= AppConfig.TX_COMMIT_SECONDS):
+            await self._commit()
+
+    async def maybe_commit(self):
+        """供空闲的消费者调用，保证时长阈值在无新写入时也能生效"""
+        async with self._write_lock:
+            await self._maybe_commit()
+
+    async def save_batch(self, records: List[tuple]) -> bool:
+        """
+        批量写入，使用 INSERT OR IGNORE 自动去重 (records 为数据库行元组)
+        整块按 _chunk_rows 行展开为多行 VALUES，比逐行 executemany 少走 step 循环；不足一块的尾部走单行 executemany
+        写入进入共享的长事务，按 TX_COMMIT_ROWS / TX_COMMIT_SECONDS 分组提交以减少 fsync
+        返回是否写入成功，供调用方决定能否推进断点
+        """
+        if not records: return True
+        step = self._chunk_rows
+        try:
+            async with self._write_lock:
+                await self._begin()
+                full = len(records) - len(records) % step
+                for i in range(0, full, step):
+                    params = [v for row in records[i:i + step] for v in row]
+                    await self._writer_conn.execute(self._insert_chunk_sql, params)
+                if full < len(records):
+                    await self._writer_conn.executemany(self._insert_one_sql, records[full:])
+                self._pending += len(records)
+                await self._maybe_commit()
+            return True
         except Exception as e:
             logger.error(f"DB 写入异常: {e}")
+            return False
+
+    async def load_checkpoint(self, repo: str) -> Optional[tuple]:
+        """读取仓库断点，返回 (cursor, max_ts, since, until) 或 None"""
+        async with self._reader_conn.execute(
+            "SELECT cursor, max_ts, since, until FROM checkpoints WHERE repo = ?", (repo,)
+        ) as cur:
+            return await cur.fetchone()
+
+    async def save_checkpoint(self, repo: str, cursor: Optional[str], max_ts: int, since: str, until: str):
+        """UPSERT 仓库断点 (与对应的行写入处于同一分组事务，一同提交)"""
+        try:
+            async with self._write_lock:
+                await self._begin()
+                await self._writer_conn.execute(
+                    """INSERT INTO checkpoints (repo, cursor, max_ts, since, until) VALUES (?,?,?,?,?)
+                       ON CONFLICT(repo) DO UPDATE SET
+                           cursor = excluded.cursor, max_ts = excluded.max_ts,
+                           since = excluded.since, until = excluded.until""",
+                    (repo, cursor, max_ts, since, until)
+                )
+                await self._maybe_commit()
+        except Exception as e:
+            logger.error(f"断点写入异常: {e}")
+
+    async def clear_checkpoint(self, repo: str):
+        """删除仓库断点 (游标失效或窗口不匹配时调用)，下次从头采集"""
+        try:
+            async with self._write_lock:
+                await self._begin()
+                await self._writer_conn.execute("DELETE FROM checkpoints WHERE repo = ?", (repo,))
+                await self._maybe_commit()
+        except Exception as e:
+            logger.error(f"断点清除异常: {e}")
+
+    async def run_maintenance(self, interval: float = 900):
+        """后台维护任务：定期执行 PRAGMA optimize 以更新查询规划统计"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                async with self._write_lock:
+                    await self._writer_conn.execute("PRAGMA optimize")
+            except Exception as e:
+                logger.debug(f"PRAGMA optimize 失败: {e}")
 
     async def close(self):
-        if self._conn: await self._conn.close()
+        if self._writer_conn:
+            # 关闭前强制提交未完成的分组事务
+            async with self._write_lock:
+                await self._commit()
+                await self._writer_conn.execute("PRAGMA optimize")
+                # 回写并截断 WAL，避免长时间运行后遗留 GB 级 WAL 文件
+                await self._writer_conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            await self._writer_conn.close()
+        if self._reader_conn:
+            await self._reader_conn.close()
 
 # ==============================================================================
 # 模块 4: [Core] 核心业务层
@@ -221,112 +433,273 @@ class AsyncDatabase:
 class CollectionEngine:
     """采集引擎：协调 API 请求与数据库写入"""
     
-    def __init__(self, token_pool: TokenPool, db: AsyncDatabase):
+    def __init__(self, token_pool: TokenPool, db: AsyncDatabase, session: aiohttp.ClientSession):
         self.token_pool = token_pool
         self.db = db
-        # 有界队列：提供背压 (Backpressure) 防止内存溢出
-        self.data_queue = asyncio.Queue(maxsize=1000)
-        self.stats = {"saved": 0}
-
-    async def _fetch_page(self, session: aiohttp.ClientSession, variables: dict) -> Optional[dict]:
-        """封装单次 API 请求，包含重试与限流处理"""
+        # 所有生产者共享同一会话与连接池，复用 TCP/TLS 连接
+        self.session = session
+        # 背压 (Backpressure) 按积压行数而非队列元素数计算：每页行数不定 (含空页)，
+        # 队列本身不设上限，由生产者在积压行数达到 QUEUE_MAX_ROWS 时等待消费者取走数据
+        self.data_queue: asyncio.Queue = asyncio.Queue()
+        self._rows_in_flight = 0  # 已入队但尚未被消费者取走的行数
+        self._queue_room = asyncio.Event()  # 积压行数低于阈值时置位
+        self._queue_room.set()
+        # 计数器仅在事件循环线程内累加，无需加锁；由 report_progress 定期渲染
+        self.stats = {"fetched": 0, "saved": 0}
+        # 断点推进状态：多个消费者可能乱序落库，只有连续已落库的页才能推进断点
+        self._ckpt_windows: Dict[str, Tuple[str, str]] = {}       # repo -> (since, until)
+        self._ckpt_next_seq: Dict[str, int] = {}                  # repo -> 下一个待确认的页序号
+        self._ckpt_saved: Dict[str, Dict[int, tuple]] = {}        # repo -> {页序号: (cursor, max_ts)}
+
+    async def _advance_checkpoints(self, pages: List[tuple]):
+        """记录已落库的页 (repo, seq, cursor, max_ts)，并将断点推进到连续已落库的最大页"""
+        touched = set()
+        for repo, seq, cursor, max_ts in pages:
+            self._ckpt_saved.setdefault(repo, {})[seq] = (cursor, max_ts)
+            touched.add(repo)
+        for repo in touched:
+            saved = self._ckpt_saved[repo]
+            seq = self._ckpt_next_seq.get(repo, 0)
+            latest = None
+            while seq in saved:
+                latest = saved.pop(seq)
+                seq += 1
+            self._ckpt_next_seq[repo] = seq
+            if latest is not None:
+                since, until = self._ckpt_windows[repo]
+                await self.db.save_checkpoint(repo, latest[0], latest[1], since, until)
+
+    @staticmethod
+    def _checkpoint_matches(ckpt_since: Optional[str], ckpt_until: Optional[str], since: str, until: str) -> bool:
+        """断点窗口与本次请求长度一致 (同一 --days) 且终点相差不超过 CHECKPOINT_MAX_DRIFT 时才可续传"""
+        try:
+            c_since, c_until = datetime.fromisoformat(ckpt_since), datetime.fromisoformat(ckpt_until)
+            r_since, r_until = datetime.fromisoformat(since), datetime.fromisoformat(until)
+            return (c_until - c_since == r_until - r_since
+                    and abs((r_until - c_until).total_seconds()) <= AppConfig.CHECKPOINT_MAX_DRIFT)
+        except (TypeError, ValueError):
+            return False
+
+    @staticmethod
+    def _build_body_prefix(owner: str, name: str) -> bytes:
+        """按仓库特化查询并预序列化，返回请求体中 variables 之前的固定部分"""
+        query = AppConfig.GRAPHQL_TEMPLATE % {
+            # JSON 字符串字面量与 GraphQL 字符串转义规则兼容
+            "owner": json.dumps(owner), "name": json.dumps(name), "page_size": AppConfig.PAGE_SIZE
+        }
+        return json.dumps({"query": query})[:-1].encode() + b',"variables":'
+
+    async def _fetch_page(self, body_prefix: bytes, variables: dict) -> Optional[dict]:
+        """
+        封装单次 API 请求，包含重试与限流处理 (每页仅序列化 variables)
+        返回值: 成功时为响应体；GitHub 拒绝请求 (非限流的 GraphQL errors) 时原样返回含 "errors" 的响应体；
+        网络异常或非 200 响应重试耗尽时返回 None。调用方据此区分 "游标/查询被拒" 与 "暂时不可达"
+        """
+        body = body_prefix + json_dumps_bytes(variables) + b"}"
         for attempt in range(AppConfig.MAX_RETRIES):
-            token = await self.token_pool.get_token()
-            headers = {"User-Agent": "GH-Col-v4", "Authorization": f"Bearer {token}"} if token else {}
+            token, headers = await self.token_pool.get_token()
             
             try:
-                async with session.post(
+                async with self.session.post(
                     AppConfig.API_URL, 
-                    json={"query": AppConfig.GRAPHQL_TEMPLATE, "variables": variables}, 
+                    data=body,
                     headers=headers, 
                     timeout=AppConfig.TIMEOUT
                 ) as resp:
                     if resp.status == 200:
-                        res = await resp.json()
+                        # 主动限流：本次请求已用尽额度时立即冷却至重置时刻，
+                        # 让后续请求换用其他 Token，而不是先撞上一次必然失败的限流
+                        if token and resp.headers.get("X-RateLimit-Remaining") == "0":
+                            self.token_pool.penalize(token, self._rate_limit_wait(resp.headers))
+                        # 直接解析原始字节，省去 resp.json() 先解码为 str 的整页副本
+                        res = json_loads(await resp.read())
                         # GraphQL 错误处理
                         if "errors" in res:
                             logger.error(f"GraphQL Error: {res['errors'][0].get('message')}")
                             # 识别 API 限流
                             if "rate limit" in str(res).lower() and token:
-                                self.token_pool.penalize(token, 300)
+                                self.token_pool.penalize(token, self._rate_limit_wait(resp.headers))
                                 continue
-                            return None
                         return res
                     
                     # HTTP 限流处理 (403/429)
-                    if resp.status in (403, 429):
-                        wait = int(resp.headers.get("Retry-After", 60))
-                        if token: self.token_pool.penalize(token, wait)
-                    
-                    # 指数退避
-                    await asyncio.sleep(1 * (2 ** attempt)) 
+                    if resp.status in (403, 429) and token:
+                        self.token_pool.penalize(token, self._rate_limit_wait(resp.headers))
             except Exception as e:
                 logger.debug(f"Req Error: {e}")
-                await asyncio.sleep(1)
+            
+            # 指数退避 + 全抖动 (上限 30s)：避免多个协程在同一时刻集中重试
+            await asyncio.sleep(random.uniform(0, min(2 ** attempt, 30)))
         return None
 
-    async def producer(self, repo: str, since: str, until: str, pbar: tqdm):
-        """生产者：翻页抓取 -> 解析数据 -> 推送队列"""
+    @staticmethod
+    def _rate_limit_wait(headers) -> int:
+        """计算限流冷却时长：优先 Retry-After (二级限流)，其次以 X-RateLimit-Reset 为准确的恢复时刻"""
+        retry_after = headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return int(retry_after)
+        reset = headers.get("X-RateLimit-Reset")
+        if headers.get("X-RateLimit-Remaining") == "0" and reset and reset.isdigit():
+            return max(int(reset) - int(time.time()), 0) + 1
+        return 60
+
+    async def producer(self, repo: str, since: str, until: str):
+        """
+        生产者：翻页抓取 -> 解析数据 -> 推送队列
+        若存在未完成且窗口匹配的断点，沿用其时间窗口与游标续传，跳过已落库的页；
+        窗口不匹配或断点游标被 GitHub 拒绝时清除断点，按本次窗口从头采集；
+        续传的首次请求因网络原因失败时保留断点，本次跳过该仓库
+        """
         owner, name = repo.split("/")
-        vars = {"owner": owner, "name": name, "since": since, "until": until, "cursor": None}
+        cursor, max_ts = None, 0
+        resumed = False
+        ckpt = await self.db.load_checkpoint(repo)
+        if ckpt and ckpt[0]:
+            if self._checkpoint_matches(ckpt[2], ckpt[3], since, until):
+                cursor, max_ts = ckpt[0], ckpt[1] or 0
+                resumed = True
+                logger.info(f"[{repo}] 从断点续传 (窗口: {ckpt[2]} -> {ckpt[3]})")
+            else:
+                logger.info(f"[{repo}] 断点窗口与本次请求不一致，丢弃断点并重新采集")
+                await self.db.clear_checkpoint(repo)
+        window = (ckpt[2], ckpt[3]) if resumed else (since, until)
+        vars = {"since": window[0], "until": window[1], "cursor": cursor}
+        body_prefix = self._build_body_prefix(owner, name)
+        self._ckpt_windows[repo] = window
+        self._ckpt_next_seq[repo] = 0
+        self._ckpt_saved[repo] = {}
+        seq = 0
         
-        async with aiohttp.ClientSession() as session:
-            while True:
-                data = await self._fetch_page(session, vars)
-                if not data: break
-                
+        next_fetch: Optional[asyncio.Task] = None
+        try:
+            data = await self._fetch_page(body_prefix, vars)
+            if resumed and data is None:
+                # 网络故障或服务端暂时不可用：断点仍然有效，保留供下次续传
+                logger.warning(f"[{repo}] 续传请求失败 (网络或服务端错误)，保留断点，本次跳过")
+                return
+            if resumed and "errors" in data:
+                # 游标被拒 (过期、非法或分支历史被改写)：清除断点，以本次窗口从头采集，避免每次运行都卡在同一游标
+                logger.warning(f"[{repo}] 断点游标失效，清除断点并从头采集")
+                await self.db.clear_checkpoint(repo)
+                max_ts = 0
+                vars = {"since": since, "until": until, "cursor": None}
+                self._ckpt_windows[repo] = (since, until)
+                data = await self._fetch_page(body_prefix, vars)
+            while data and "errors" not in data:
                 try:
                     history = data["data"]["repository"]["defaultBranchRef"]["target"]["history"]
                 except (TypeError, KeyError):
                     break # 数据结构异常或无权限
 
+                page_info = history["pageInfo"]
+                next_cursor = page_info["endCursor"] if page_info["hasNextPage"] else None
+                # 游标预取：拿到游标后立即发起下一页请求，与本页解析、入队重叠
+                if next_cursor is not None:
+                    vars = {**vars, "cursor": next_cursor}
+                    next_fetch = asyncio.create_task(self._fetch_page(body_prefix, vars))
+
                 batch = []
-                for edge in history.get("edges", []):
+                # 热循环局部别名：省去每条 commit 的全局/属性查找
+                append, parse_ts = batch.append, parse_github_ts
+                for edge in history.get("edges") or ():
                     node = edge["node"]
-                    # 数据转换
-                    batch.append(CommitRecord(
-                        repo_name=repo,
-                        commit_sha=node["oid"],
-                        timestamp_unix=int(datetime.fromisoformat(node["committedDate"].replace("Z", "+00:00")).timestamp()),
-                        author_login=node.get("author", {}).get("user", {}).get("login", "Unknown") or "Unknown",
-                        author_name=node.get("author", {}).get("name", "Unknown"),
-                        author_email=node.get("author", {}).get("email", ""),
-                        message=node["messageHeadline"]
+                    # author / author.user 可能为 null (如未关联 GitHub 账号的提交者)
+                    user = (node.get("author") or {}).get("user")
+                    # 数据转换：直接构造数据库行元组
+                    append((
+                        node["oid"],
+                        repo,
+                        (user and user.get("login")) or "Unknown",
+                        parse_ts(node["committedDate"]),
+                        node["messageHeadline"]
                     ))
                 
                 if batch:
-                    await self.data_queue.put(batch) # 队列满时阻塞
-                    pbar.update(len(batch))
-
-                if history["pageInfo"]["hasNextPage"]:
-                    vars["cursor"] = history["pageInfo"]["endCursor"]
-                else:
+                    max_ts = max(max_ts, max(row[3] for row in batch))
+
+                # 每页 (含空页) 都携带断点信息入队，落库后由消费者推进断点
+                item = (batch, (repo, seq, next_cursor, max_ts))
+                seq += 1
+                # 积压行数达到阈值时阻塞；未达阈值时直接入队，不经过一次事件循环调度
+                while self._rows_in_flight >= AppConfig.QUEUE_MAX_ROWS:
+                    self._queue_room.clear()
+                    await self._queue_room.wait()
+                self.data_queue.put_nowait(item)
+                self._rows_in_flight += len(batch)
+                self.stats["fetched"] += len(batch)
+
+                if next_fetch is None:
                     break
+                data = await next_fetch
+                next_fetch = None
+        finally:
+            # 异常退出时取消尚未完成的预取请求
+            if next_fetch is not None and not next_fetch.done():
+                next_fetch.cancel()
+
+    def _render_progress(self, started: float):
+        """将当前计数渲染到终端同一行"""
+        elapsed = max(time.monotonic() - started, 1e-6)
+        fetched = self.stats["fetched"]
+        sys.stderr.write(
+            f"\rFetching: {fetched} commits | saved: {self.stats['saved']} | {fetched / elapsed:.1f} commits/s"
+        )
+        sys.stderr.flush()
+
+    async def report_progress(self, interval: float = 0.5):
+        """进度渲染任务：以固定频率刷新终端，使生产者热路径不触碰任何锁或 stdout"""
+        started = time.monotonic()
+        try:
+            while True:
+                self._render_progress(started)
+                await asyncio.sleep(interval)
+        finally:
+            self._render_progress(started)
+            sys.stderr.write("\n")
 
     async def consumer(self):
-        """消费者：读取队列 -> 缓冲 -> 批量写库"""
+        """消费者：读取队列 -> 缓冲 -> 批量写库 (可启动多个实例，各自持有缓冲区)"""
         buffer = []
+        pages = []  # 缓冲区中各页的断点信息，落库成功后再推进
         while True:
-            batch = await self.data_queue.get()
+            try:
+                item = await asyncio.wait_for(self.data_queue.get(), timeout=AppConfig.TX_COMMIT_SECONDS)
+            except asyncio.TimeoutError:
+                # 队列空闲 (如所有 Token 冷却、生产者停滞)：先落库本消费者缓冲中的残余行及其断点
+                # (含空页的断点，如标记仓库采集完毕的末页)，再让时长阈值生效，保证数据最长约 TX_COMMIT_SECONDS 即写入并提交
+                if buffer or pages:
+                    await self._flush(buffer, pages)
+                await self.db.maybe_commit()
+                continue
             
             # 哨兵模式：接收 None 退出
-            if batch is None:
+            if item is None:
                 self.data_queue.task_done()
                 break
             
+            batch, page = item
+            self._rows_in_flight -= len(batch)
+            if self._rows_in_flight < AppConfig.QUEUE_MAX_ROWS:
+                self._queue_room.set()
             buffer.extend(batch)
+            pages.append(page)
             # 批量写入优化 IO
             if len(buffer) >= AppConfig.WRITE_BATCH_SIZE:
-                await self.db.save_batch(buffer)
-                self.stats["saved"] += len(buffer)
-                buffer.clear()
+                await self._flush(buffer, pages)
             
             self.data_queue.task_done()
         
         # 清理残余
-        if buffer:
-            await self.db.save_batch(buffer)
+        if buffer or pages:
+            await self._flush(buffer, pages)
+
+    async def _flush(self, buffer: List[tuple], pages: List[tuple]):
+        """落库缓冲区，成功后推进对应页的断点，并清空两个缓冲"""
+        if await self.db.save_batch(buffer):
             self.stats["saved"] += len(buffer)
+            await self._advance_checkpoints(pages)
+        buffer.clear()
+        pages.clear()
 
 # ==============================================================================
 # 模块 5: [Main] 入口模块 (专业优化版)
@@ -345,7 +718,7 @@ def parse_arguments():
     group.add_argument("-r", "--repos", type=str, help="目标仓库列表，逗号分隔 (例: owner/repo1,owner/repo2)")
     group.add_argument("-f", "--file", type=str, help="仓库列表文件路径 (每行一个 owner/repo)")
     
-    parser.add_argument("-d", "--days", type=int, default=30, help="采集过去多少天的数据 (默认: 30)")
+    parser.add_argument("-d", "--days", type=int, default=30, help="采集过去多少天的数据 (默认: 30)；相同天数且 24 小时内中断的任务会沿用原时间窗口断点续传")
     parser.add_argument("--db", type=str, default=AppConfig.DB_PATH, help=f"数据库输出路径 (默认: {AppConfig.DB_PATH})")
     
     return parser.parse_args()
@@ -390,22 +763,32 @@ async def main():
     # 使用 args.db 允许用户自定义输出位置
     db = AsyncDatabase(args.db)
     token_pool = TokenPool(AppConfig.GITHUB_TOKENS)
-    engine = CollectionEngine(token_pool, db)
+    # 全局共享的 HTTP 会话：连接池覆盖所有并发仓库，DNS 与 keep-alive 连接跨仓库复用
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=AppConfig.CONCURRENT_REPOS * 2, ttl_dns_cache=300, keepalive_timeout=60
+        ),
+        timeout=AppConfig.TIMEOUT
+    )
+    engine = CollectionEngine(token_pool, db, session)
     
     # 3. 计算时间窗口
     until_ts = datetime.now(timezone.utc)
     since_ts = until_ts - timedelta(days=args.days)
     logger.info(f"采集时间窗口: {since_ts.date()} -> {until_ts.date()} ({args.days} days)")
 
-    # 进度条初始化
-    pbar = tqdm(total=0, desc="Fetching", unit=" commits", dynamic_ncols=True)
-
     try:
         await db.connect()
         
+        # 进度渲染：后台 2Hz 刷新
+        progress_task = asyncio.create_task(engine.report_progress())
+        # 数据库维护：每 15 分钟 PRAGMA optimize
+        maintenance_task = asyncio.create_task(db.run_maintenance())
+        
         # 4. 启动异步任务
         # 消费者：后台运行 (fire and forget pattern, but monitored)
-        consumer_task = asyncio.create_task(engine.consumer())
+        # 多个消费者让组装缓冲与写库相互重叠
+        consumer_tasks = [asyncio.create_task(engine.consumer()) for _ in range(AppConfig.CONSUMER_COUNT)]
         
         # 生产者：创建任务列表
         sem = asyncio.Semaphore(AppConfig.CONCURRENT_REPOS)
@@ -414,20 +797,37 @@ async def main():
             """带信号量保护的生产者包装器"""
             async with sem:
                 try:
-                    await engine.producer(repo, since_ts.isoformat(), until_ts.isoformat(), pbar)
+                    await engine.producer(repo, since_ts.isoformat(), until_ts.isoformat())
                 except Exception as e:
                     logger.error(f"[{repo}] 采集失败: {e}")
 
         # 创建所有生产者任务
         producer_tasks = [asyncio.create_task(protected_producer(repo)) for repo in target_repos]
+
+        loop = asyncio.get_running_loop()
+
+        def request_stop():
+            """SIGTERM：取消生产者，随后走正常结束流程，已入队数据落库、断点保留供续传"""
+            logger.warning("收到终止信号，停止采集并写入剩余数据 (再次发送将立即终止)...")
+            # 仅拦截第一次：移除处理器后再次 SIGTERM 恢复默认的立即终止行为
+            loop.remove_signal_handler(signal.SIGTERM)
+            for t in producer_tasks:
+                t.cancel()
+
+        # 信号回调由事件循环调度执行，不会打断进行中的请求或事务 (Windows 不支持，保持默认行为)
+        try:
+            loop.add_signal_handler(signal.SIGTERM, request_stop)
+        except (NotImplementedError, AttributeError):
+            pass
         
         # 等待所有生产者完成
         # return_exceptions=True 确保个别任务崩溃不影响整体流程
         await asyncio.gather(*producer_tasks, return_exceptions=True)
         
         # 5. 正常结束流程
-        await engine.data_queue.put(None) # 发送哨兵信号
-        await consumer_task               # 等待消费者落库完毕
+        for _ in consumer_tasks:
+            await engine.data_queue.put(None) # 每个消费者一个哨兵信号
+        await asyncio.gather(*consumer_tasks) # 等待消费者落库完毕
 
     except asyncio.CancelledError:
         logger.warning("\n任务被取消，正在停止...")
@@ -436,16 +836,23 @@ async def main():
     finally:
         # 6. 资源清理与优雅关闭 (Context Cleanup)
         # 确保即使在报错或 Ctrl+C 时也能保存队列中剩余的数据
-        if 'consumer_task' in locals() and not consumer_task.done():
+        pending = [t for t in locals().get('consumer_tasks', []) if not t.done()]
+        if pending:
             logger.info("正在等待剩余数据写入数据库...")
-            await engine.data_queue.put(None)
+            for _ in pending:
+                await engine.data_queue.put(None)
             try:
                 # 给予消费者 10秒 宽限期将缓冲区写入磁盘
-                await asyncio.wait_for(consumer_task, timeout=10.0)
+                await asyncio.wait_for(asyncio.gather(*pending), timeout=10.0)
             except asyncio.TimeoutError:
                 logger.error("写入超时，部分数据可能丢失")
         
-        pbar.close()
+        scope = locals()
+        background = [scope[n] for n in ('progress_task', 'maintenance_task') if n in scope]
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+        await session.close()
         await db.close()
         
         final_count = engine.stats['saved']
@@ -457,6 +864,13 @@ if __name__ == "__main__":
         # Windows 平台 asyncio 兼容性补丁
         if sys.platform == 'win32':
             asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        else:
+            # 可选加速：安装 uvloop 时使用基于 libuv 的事件循环，降低每个任务/请求的调度开销
+            try:
+                import uvloop
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+            except ImportError:
+                pass
             
         asyncio.run(main())
     except KeyboardInterrupt:
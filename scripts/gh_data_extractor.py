@@ -1,4 +1,5 @@
 import asyncio
+import calendar
 import json
 import logging
 import os
@@ -31,6 +32,13 @@ except ImportError as e:
 # --- Windows 兼容性 ---
 if sys.platform.startswith('win'):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+else:
+    # 可选加速: 安装 uvloop 时替换默认事件循环，未安装则保持标准 asyncio
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
 
 # --- 配置定义 ---
 @dataclass
@@ -44,6 +52,7 @@ class AppConfig:
     report_path: str = "reports/insight_report.html"
     lookback_days: int = 30
     concurrency: int = 5
+    write_batch_size: int = 1000
     log_level: str = "INFO"
     
     # API 常量 (通常不通过外部配置修改)
@@ -107,11 +116,23 @@ def async_retry(retries: int = 3, delay: int = 1, backoff: int = 2):
 # 职责: 定义核心业务对象的结构，保证数据流转的一致性
 # =============================================================================
 
-@dataclass
+def parse_github_ts(s: str) -> int:
+    """
+    [数据模块] 将 GitHub 返回的 ISO-8601 UTC 时间 (YYYY-MM-DDTHH:MM:SSZ) 转为 Unix 时间戳
+    固定格式直接按位切片取整，省去每条记录的 datetime 对象构造；非标准格式回退 fromisoformat。
+    """
+    if len(s) == 20 and s[19] == "Z":
+        return calendar.timegm((
+            int(s[0:4]), int(s[5:7]), int(s[8:10]), int(s[11:13]), int(s[14:16]), int(s[17:19]), 0, 0, 0
+        ))
+    return int(datetime.fromisoformat(s.replace("Z", "+00:00")).timestamp())
+
+@dataclass(frozen=True, slots=True)
 class CommitRecord:
     """
     [数据模块] 单条 Commit 记录的标准结构
     包含从 GitHub 获取的元数据以及后期解析出的地理信息。
+    写入缓冲区会累积上千条记录，slots=True 省去每个实例的 __dict__；构造后不再修改，故冻结。
     """
     sha: str
     repo_name: str
@@ -154,6 +175,12 @@ class StorageManager:
                 self.db_path.parent.mkdir(parents=True, exist_ok=True)
                 self.conn = sqlite3.connect(self.db_path)
                 self.conn.row_factory = sqlite3.Row
+                # 连接在整个运行期复用，PRAGMA 只需在打开时设置一次
+                self.conn.execute("PRAGMA journal_mode=WAL")
+                self.conn.execute("PRAGMA synchronous=NORMAL")
+                self.conn.execute("PRAGMA temp_store=MEMORY")
+                self.conn.execute("PRAGMA cache_size=-65536")
+                self.conn.execute("PRAGMA busy_timeout=5000")
                 self._init_schema()
             except OSError as e:
                 logger.error(f"无法初始化数据库: {e}")
@@ -161,6 +188,11 @@ class StorageManager:
 
     def close(self):
         if self.conn:
+            # 关闭前让 SQLite 按本次运行的查询模式更新统计信息 (开销很小，仅在需要时执行 ANALYZE)
+            try:
+                self.conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                logger.debug(f"PRAGMA optimize 失败: {e}")
             self.conn.close()
             self.conn = None
 
@@ -352,18 +384,20 @@ class GitHubService:
             "User-Agent": config.USER_AGENT
         }
         self._user_info_cache: Dict[str, str] = {}
+        # 用户信息查询并发上限: 明显低于连接池上限，给翻页请求留出连接，
+        # 同时避免突发的并行 /users 请求触发 GitHub 二级限流
+        self._lookup_sem = asyncio.Semaphore(max(1, config.concurrency // 2))
 
-    async def _handle_rate_limit(self, resp: aiohttp.ClientResponse):
-        """检查 API 速率限制，若耗尽则自动挂起等待"""
+    def _rate_limit_wait(self, resp: aiohttp.ClientResponse) -> float:
+        """检查 API 速率限制，若耗尽返回需等待的秒数 (否则为 0)；由调用方在释放连接后再休眠"""
         if resp.status == 403 and 'X-RateLimit-Remaining' in resp.headers:
             remaining = int(resp.headers.get('X-RateLimit-Remaining', 1))
             if remaining == 0:
                 reset_ts = int(resp.headers.get('X-RateLimit-Reset', 0))
                 wait_time = max(reset_ts - time.time(), 0) + 1
                 logger.warning(f"GitHub API 限流触发，自动等待 {wait_time:.0f}s")
-                await asyncio.sleep(wait_time)
-                return True
-        return False
+                return wait_time
+        return 0
 
     @async_retry()
     async def get_user_location(self, username: str) -> str:
@@ -373,19 +407,27 @@ class GitHubService:
             return self._user_info_cache[username]
 
         url = f"{self.config.GITHUB_API_BASE}/users/{username}"
-        async with self.session.get(url, headers=self.base_headers) as resp:
-            if await self._handle_rate_limit(resp):
-                return await self.get_user_location(username)
-            
-            location = ""
-            if resp.status == 200:
-                data = await resp.json()
-                location = data.get("location") or ""
-            elif resp.status != 404:
-                logger.debug(f"用户 {username} 信息获取失败: {resp.status}")
+        async with self._lookup_sem:
+            # 排队期间可能已被其他仓库的任务查询过
+            if username in self._user_info_cache:
+                return self._user_info_cache[username]
+
+            while True:
+                async with self.session.get(url, headers=self.base_headers) as resp:
+                    wait_time = self._rate_limit_wait(resp)
+                    if not wait_time:
+                        location = ""
+                        if resp.status == 200:
+                            data = await resp.json()
+                            location = data.get("location") or ""
+                        elif resp.status != 404:
+                            logger.debug(f"用户 {username} 信息获取失败: {resp.status}")
+                        break
+                # 限流: 先退出 async with 归还连接，再休眠重试，避免持有连接等待其他连接造成连接池死锁
+                await asyncio.sleep(wait_time)
 
-            self._user_info_cache[username] = location
-            return location
+        self._user_info_cache[username] = location
+        return location
 
     async def fetch_commits(self, repo: str, since: datetime) -> AsyncGenerator[List[Dict], None]:
         """
@@ -401,25 +443,29 @@ class GitHubService:
         while True:
             try:
                 async with self.session.get(url, headers=self.base_headers, params=params) as resp:
-                    if await self._handle_rate_limit(resp):
-                        continue
-                    if resp.status != 200:
-                        if resp.status == 404:
-                            logger.error(f"仓库不可见或不存在: {repo}")
-                        break
-                        
-                    batch = await resp.json()
-                    if not batch or not isinstance(batch, list):
-                        break
-                    
-                    yield batch
-                    
-                    if len(batch) < 100: break
-                    params["page"] += 1
+                    wait_time = self._rate_limit_wait(resp)
+                    if not wait_time:
+                        if resp.status != 200:
+                            if resp.status == 404:
+                                logger.error(f"仓库不可见或不存在: {repo}")
+                            break
+                        batch = await resp.json()
             except Exception as e:
                 logger.error(f"Fetch loop error for {repo}: {e}")
                 break
 
+            if wait_time:
+                await asyncio.sleep(wait_time)
+                continue
+            if not batch or not isinstance(batch, list):
+                break
+
+            # 在 async with 之外 yield: 调用方处理本页 (含查询作者信息) 期间不占用连接池中的连接
+            yield batch
+
+            if len(batch) < 100: break
+            params["page"] += 1
+
 # =============================================================================
 # 模块 5: 业务逻辑控制层 (Controller / Orchestrator)
 # 职责: 协调数据库和服务，调度并发任务，执行核心 ETL 流程
@@ -440,8 +486,10 @@ class InsightEngine:
     async def run(self, projects: List[str]):
         # 初始化数据库上下文
         with StorageManager(self.config.db_path) as storage:
-            # 初始化 HTTP 连接池 (限制并发数)
-            conn = aiohttp.TCPConnector(limit=self.config.concurrency)
+            # 初始化 HTTP 连接池 (限制并发数)；DNS 结果与 keep-alive 连接在所有仓库间复用
+            conn = aiohttp.TCPConnector(
+                limit=self.config.concurrency, ttl_dns_cache=300, keepalive_timeout=60
+            )
             async with aiohttp.ClientSession(connector=conn) as session:
                 # 依赖注入
                 self.gh_service = GitHubService(session, self.config.github_token, self.config)
@@ -479,32 +527,49 @@ class InsightEngine:
                 if not to_process:
                     continue
 
-                # 3. 数据处理与补全
+                # 3. 地理信息补全: 本页去重后的作者并发查询 location，
+                #    并发度由 GitHubService 内部信号量限制 (低于连接池上限)；Nominatim 的 1 次/秒限流由 GeoService 内部信号量保证
+                authors = list({item['author']['login'] for item in to_process})
+                locations = await asyncio.gather(*(self.gh_service.get_user_location(a) for a in authors))
+                author_loc = dict(zip(authors, locations))
+
+                raw_locs = list(set(locations))
+                geo_results = await asyncio.gather(*(self.geo_service.resolve(l) for l in raw_locs))
+                loc_geo = dict(zip(raw_locs, geo_results))
+
+                # 4. 数据组装
                 for item in to_process:
                     author_login = item['author']['login']
                     sha = item['sha']
-                    
-                    # 获取并解析地理位置 (串行 await，保证顺序和限流)
-                    raw_loc = await self.gh_service.get_user_location(author_login)
-                    geo_info = await self.geo_service.resolve(raw_loc)
+                    raw_loc = author_loc[author_login]
+                    geo_info = loc_geo[raw_loc]
                     
                     # 时间格式标准化
-                    ts_str = item['commit']['author']['date'].replace("Z", "+00:00")
-                    commit_ts = datetime.fromisoformat(ts_str).timestamp()
+                    commit_ts = parse_github_ts(item['commit']['author']['date'])
 
                     new_commits_buffer.append(CommitRecord(
                         sha=sha, repo_name=repo, author_login=author_login,
-                        timestamp=int(commit_ts), raw_location=raw_loc, **geo_info
+                        timestamp=commit_ts, raw_location=raw_loc, **geo_info
                     ))
                 
-                # 4. 分批持久化 (防止内存溢出)
-                if new_commits_buffer:
+                # 5. 跨页累积后分批持久化，减少事务提交 (fsync) 次数，同时限制内存占用
+                if len(new_commits_buffer) >= self.config.write_batch_size:
                     self.storage.save_commits(new_commits_buffer)
                     commit_count += len(new_commits_buffer)
                     new_commits_buffer.clear()
 
         except Exception as e:
             logger.error(f"处理仓库 {repo} 时发生意外错误: {e}")
+        finally:
+            # 仓库结束 (或中途出错) 时落盘剩余记录，已处理的数据不丢失；
+            # 写入失败只记录日志，不向上传播，避免中断其他仓库的并发任务与报告生成
+            if new_commits_buffer:
+                try:
+                    self.storage.save_commits(new_commits_buffer)
+                    commit_count += len(new_commits_buffer)
+                except Exception as e:
+                    logger.error(f"仓库 {repo} 剩余记录写入失败: {e}")
+                new_commits_buffer.clear()
         
         if commit_count > 0:
             logger.info(f"[{repo}] 完成，新增记录: {commit_count}")